@@ -6,8 +6,8 @@ functions."""
 
 from utils import (
     is_in, argmin, argmax, argmax_random_tie, probability, weighted_sampler,
-    memoize, print_table, open_data, Stack, FIFOQueue, PriorityQueue, name,
-    distance
+    memoize, print_table, open_data, Stack, FIFOQueue, PriorityQueue,
+    BucketQueue, name, distance
 )
 
 from collections import defaultdict
@@ -66,6 +66,17 @@ class Problem(object):
         and action. The default method costs 1 for every step in the path."""
         return c + 1
 
+    def expand_batch(self, state, c=0):
+        """Return an (action, next state, path cost) triple for every action
+        in the given state, assuming cost c to get up to it. Node.expand uses
+        it instead of a result and path_cost call per child, so a subclass
+        can override it to build all the children at once."""
+        children = []
+        for action in self.actions(state):
+            next = self.result(state, action)
+            children.append((action, next, self.path_cost(c, state, action, next)))
+        return children
+
     def value(self, state):
         """For optimization problems, each state has a value.  Hill-climbing
         and related algorithms try to maximize this value."""
@@ -102,6 +113,9 @@ class Node:
 
     def expand(self, problem):
         """List the nodes reachable in one step from this node."""
+        if hasattr(problem, 'expand_batch'):
+            return [Node(next, self, action, cost)
+                    for action, next, cost in problem.expand_batch(self.state, self.path_cost)]
         return [self.child_node(problem, action)
                 for action in problem.actions(self.state)]
 
@@ -241,6 +255,19 @@ def breadth_first_search(problem):
     return None
 
 
+def best_first_frontier(problem, f, node):
+    """Return an empty frontier for best_first_graph_search. A problem whose
+    f values are small non-negative integers says so with an f_bound
+    attribute (the largest f it expects); if f(node) fits, the frontier is a
+    BucketQueue with the problem's tie_order (default 'sorted'), otherwise
+    a PriorityQueue."""
+    bound = getattr(problem, 'f_bound', None)
+    value = f(node)
+    if bound is not None and isinstance(value, int) and 0 <= value <= bound:
+        return BucketQueue(f, getattr(problem, 'tie_order', 'sorted'), bound + 1)
+    return PriorityQueue(min, f)
+
+
 def best_first_graph_search(problem, f):
     """Search the nodes with the lowest f scores first.
     You specify the function f(node) that you want to minimize; for example,
@@ -253,7 +280,7 @@ def best_first_graph_search(problem, f):
     node = Node(problem.initial)
     if problem.goal_test(node.state):
         return node
-    frontier = PriorityQueue(min, f)
+    frontier = best_first_frontier(problem, f, node)
     frontier.append(node)
     explored = set()
     while frontier:
@@ -1295,6 +1322,12 @@ class InstrumentedProblem(Problem):
     def path_cost(self, c, state1, action, state2):
         return self.problem.path_cost(c, state1, action, state2)
 
+    def expand_batch(self, state, c=0):
+        self.succs += 1
+        children = self.problem.expand_batch(state, c)
+        self.states += len(children)
+        return children
+
     def value(self, state):
         return self.problem.value(state)
 
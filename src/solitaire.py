@@ -5,78 +5,220 @@
 #
 ##############################################################
 
+import os
 import sys
+import ast
+import json
+import time
+import queue
+import signal
+import argparse
+import multiprocessing
+import mmap
+import array
+import shutil
+import tempfile
+import random
+import heapq
 from search import *
+from utils import TranspositionTable
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+# Where tablebases and pattern databases are kept, next to src unless the
+# SOLITAIRE_CACHE environment variable says otherwise
+CACHE_DIR = os.environ.get('SOLITAIRE_CACHE',
+	os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tablebase'))
 
 class sol_state():
-	'''Represents a solitaire board.'''
+	'''Represents a solitaire board. The board is kept as an integer bitboard
+	of pegs over the shared tables of its shape (see sol_shape). Boards that
+	are images of each other under a symmetry of the shape are equal: the
+	hash is the smallest of the Zobrist hashes of all the images. The list of
+	moves is generated at most once and also orders states by mobility. As
+	every jump removes one peg, the number of pegs is counted once and then
+	decremented along the way.'''
 
-	__slots__ = ['board']
+	__slots__ = ['shape', 'pegs', 'count', 'keys', 'key', 'canon', 'moves', 'dist']
 
 	def __init__(self, board):
-		self.board = board
+		self.shape = board_shape(board)
+		self.pegs = board_pegs(self.shape, board)
+		self.count = bin(self.pegs).count('1')
+		self.keys = bits_zobrist(self.shape, self.pegs)
+		self.key = min(self.keys)
+		self.canon = None
+		self.moves = None
+		self.dist = bits_weight(self.shape, self.pegs)
+
+	@property
+	def board(self):
+		return shape_board(self.shape, self.pegs)
 
 	def get_board(self):
 		return self.board
 
+	def get_count(self):
+		return self.count
+
+	def get_moves(self):
+		if self.moves is None:
+			self.moves = bits_moves(self.shape, self.pegs)
+		return self.moves
+
 	def __lt__(self, otherState):
-		return len(board_moves(self.get_board())) > len(board_moves(otherState.get_board()))
+		return len(self.get_moves()) > len(otherState.get_moves())
+
+	def __eq__(self, otherState):
+		if not isinstance(otherState, sol_state) or self.shape is not otherState.shape:
+			return False
+		return self.pegs == otherState.pegs or (self.key == otherState.key and
+			self.canonical() == otherState.canonical())
+
+	def __hash__(self):
+		return self.key
+
+	def canonical(self):
+		'''Returns the smallest peg mask among the symmetric images of the board.'''
+		if self.canon is None:
+			self.canon = bits_canonical(self.shape, self.pegs)
+		return self.canon
 
 class solitaire(Problem):
 	'''Models a Solitaire problem as a satisfaction problem.
 	A solution can only have one piece left in the board.'''
 
-	def __init__(self, board):
+	def __init__(self, board, tie_order='sorted', prune=False, tablebase=0, cache=CACHE_DIR):
+		'''tie_order is how best first searches order nodes with the same f:
+		'lifo', 'fifo' or 'sorted' (more mobile states first). With prune,
+		actions leaves out the moves to boards proven unsolvable (see dead),
+		otherwise it returns every legal move. A tablebase of k pegs (see
+		shape_tablebase) answers for every board with k or fewer pegs.
+		cache is the directory of the tablebases and pattern databases, or
+		None to keep them in memory only.'''
 		super().__init__(sol_state(board))
 
+		self.cache = cache
+		self.tablebase = shape_tablebase(self.initial.shape, tablebase, cache) if tablebase else None
+
+		# Path cost and h are small integers, at most this much, so best first
+		# searches can keep their frontier in buckets
+		self.f_bound = self.initial.count * len(self.initial.shape.levels)
+		self.tie_order = tie_order
+
+		self.prune = prune
+
+		# Jumps keep the position class, so boards whose class no single peg
+		# has are rejected up front: the solvers below and the batch command
+		# return at once for them, while actions still lists every move
+		self.solvable = self.initial.count <= 1 or bool(self.end_cells(self.initial.pegs))
+
+		# What builds the same problem on another board, as the workers of the
+		# parallel solvers do
+		self.options = {'tie_order': tie_order, 'prune': prune, 'tablebase': tablebase, 'cache': cache}
+
 	def actions(self, state):
-		'''Returns all possible next states for the state we are in.'''
-		return board_moves(state.get_board())
+		'''Returns all possible next states for the state we are in, leaving
+		out the ones proven unsolvable when pruning.'''
+		moves = state.get_moves()
+
+		# Below the tablebase size only the moves to solvable boards are kept,
+		# so any search goes straight down to a solution
+		if self.tablebase is not None and state.count - 1 <= self.tablebase.size:
+			shape = state.shape
+			return [move for move in moves if state.pegs ^ move_jump(shape, move)[2] in self.tablebase]
+
+		if self.prune:
+			shape = state.shape
+			targets = self.end_cells(state.pegs)
+			moves = [move for move in moves if not self.dead(state.pegs ^ move_jump(shape, move)[2], targets)]
+
+		return moves
+
+	def end_cells(self, pegs):
+		'''Returns the cells where a single peg has the position class of the
+		peg mask, the only ones the last peg may end on.'''
+		return self.initial.shape.class_cells.get(bits_class(self.initial.shape, pegs), [])
+
+	def dead(self, pegs, targets=None):
+		'''A peg mask cannot be solved if its pegs are stranded in regions that
+		will keep more than one of them (see bits_stranded), or if, for every
+		cell the last peg may end on, one of the pagodas of that cell has a
+		sum below the one of the goal, that is, no pegs left on it. With no
+		such cells (a position class no single peg has) every board with pegs
+		is dead. The cells come from end_cells when not given. Boards small
+		enough for the tablebase are dead if they are not in it.'''
+		if self.tablebase is not None and bin(pegs).count('1') <= self.tablebase.size:
+			return pegs not in self.tablebase
+
+		if bits_stranded(self.initial.shape, pegs) > 1:
+			return True
+
+		pagodas = shape_pagodas(self.initial.shape)
+		if targets is None:
+			targets = self.end_cells(pegs)
+
+		for cell in targets:
+			for mask in pagodas[cell]:
+				if not pegs & mask:
+					break
+			else:
+				return False
+
+		return True
 
 	def result(self, state, move):
 		'''Applies a given move to the current board.'''
-		return sol_state(board_perform_move(state.get_board(), move))
+		jump = move_jump(state.shape, move)
+		return make_state(state.shape, state.pegs ^ jump[2], state.count - 1,
+			tuple(key ^ zobrist for key, zobrist in zip(state.keys, jump[4])), state.dist + jump[5])
+
+	def expand_batch(self, state, c=0):
+		'''Returns every (move, next state, path cost) at once, making the
+		states straight from the jump table.'''
+		shape, pegs, count, keys, dist = state.shape, state.pegs, state.count - 1, state.keys, state.dist
+		children = []
+
+		for move in self.actions(state):
+			jump = move_jump(shape, move)
+			children.append((move, make_state(shape, pegs ^ jump[2], count,
+				tuple(key ^ zobrist for key, zobrist in zip(keys, jump[4])), dist + jump[5]), c + 1))
+
+		return children
 
 	def goal_test(self, state):
 		'''Board is solved if it has only one piece left.'''
-		return board_solved(state.get_board())
+		return state.count <= 1
 
 	def h(self, node):
 		'''This heuristic prefers states that have more pegs closer to the 
 		center. We sum the manhattan distance of all pegs to the center of the board -
-		the higher this sum is, the further we are from the solution.'''
-
-		# Board and size
-		board = node.state.get_board()
-		lines = len(board)
-		columns = len(board[0])
-
-		# Center
-		mid_line = lines >> 1
-		mid_column = columns >> 1
+		the higher this sum is, the further we are from the solution.
 
-		# Accumulated cost
-		cost = 0
+		The sum is kept on the state and updated by every jump, and the closest
+		peg is found with the per distance masks of the shape.'''
 
-		# Minimum cost so far
-		minCost = sys.maxsize
+		state = node.state
 
-		# Run board and for each peg accumulate their distance to the center
-		for line in range(len(board)):
-			for column in range(len(board[line])):
+		# If there is only one peg left heuristic should give 0 so we subtract the minimum cost (only one) so far
+		return state.dist - bits_min_weight(state.shape, state.pegs)
 
-				pos = get_pos(board, make_pos(line, column))
-				if(is_peg(pos)):
+	def h_pdb(self, node):
+		'''Pattern database heuristic, for the h argument of astar_search and
+		greedy_search: the pegs each region of the board would keep playing
+		on its own (see shape_patterns), added up, less the one peg of the
+		goal. Only jumps across regions can do better, so boards that are
+		solvable inside every region come first.'''
+		pegs = node.state.pegs
+		left = 0
 
-					# Manhattan distance
-					cost += abs(column - mid_column) + abs(line - mid_line)
+		for region, table in shape_patterns(node.state.shape, directory=self.cache):
+			left += table[region_index(region, pegs)]
 
-					# Save minimum
-					if ( minCost > abs(column - mid_column) + abs(line - mid_line) ):
-						minCost = abs(column - mid_column) + abs(line - mid_line)
-
-		# If there is only one peg left heuristic should gcive 0 so we subtract the minimum cost (only one) so far
-		return cost - minCost
+		return max(left - 1, 0)
 
 ##############################################################
 #
@@ -128,6 +270,12 @@ def get_pos(board, pos):
 def put_pos(board, pos, content):
 	board[pos_l(pos)][pos_c(pos)] = content
 
+# Returns a board of row tuples with the content in the position "pos",
+# sharing every other row with the given one
+def with_pos(board, pos, content):
+	row = board[pos_l(pos)]
+	return board[:pos_l(pos)] + (row[:pos_c(pos)] + (content,) + row[pos_c(pos) + 1:],) + board[pos_l(pos) + 1:]
+
 # Returns the position between the two positions (if there is one)
 def mid_pos(pos_i, pos_j):
 	mid_line = (pos_l(pos_j) - pos_l(pos_i)) >> 1
@@ -242,16 +390,28 @@ def board_moves(board):
 #
 ##############################################################
 
-def board_perform_move(board, move):
-	'''Given a board and a move performs the move on the given board and returns the changed board.'''
+def board_freeze(board):
+	'''Given a board returns it as a tuple of row tuples, which no function changes.'''
+	return tuple(tuple(row) for row in board)
 
-	# Creating a copy of the board
-	board_new = [board[i][:] for i in range(len(board))]
+def board_perform_move(board, move):
+	'''Given a board and a move performs the move on the given board and returns the changed board.
+	A board of row tuples (see board_freeze) gives one that shares the rows the move does not touch,
+	a list of lists is copied whole.'''
 
 	# Movement Positions
 	pos_initial = move_initial(move)
 	pos_final = move_final(move)
 
+	if isinstance(board, tuple):
+		pos_mid = mid_pos(pos_initial, pos_final)
+		board = with_pos(board, pos_initial, c_empty())
+		board = with_pos(board, pos_mid, c_empty())
+		return with_pos(board, pos_final, c_peg())
+
+	# Creating a copy of the board
+	board_new = [board[i][:] for i in range(len(board))]
+
 	# Empty first position
 	put_pos(board_new, pos_initial, c_empty())
 
@@ -262,4 +422,1385 @@ def board_perform_move(board, move):
 	# Fill final position
 	put_pos(board_new, pos_final, c_peg())
 
-	return board_new
\ No newline at end of file
+	return board_new
+
+##############################################################
+#
+#	BOARD SHAPES - Tables shared by all boards with the same
+#	size and blocked cells. Cell (l, c) is bit l * columns + c.
+#
+##############################################################
+
+class sol_shape():
+	'''Precomputed bitboard tables of a board shape. Every possible jump is
+	kept as (from_over, to, flip, move, zobrist, weight): the masks that must
+	hold pegs, the mask that must be empty, the mask toggled when the jump is
+	made, the matching change of the Zobrist hash of each symmetric image and
+	the change of the summed distance of the pegs to the center.
+
+	The symmetries are the dihedral transformations (only the ones that keep
+	a rectangle a rectangle unless the board is square) that map the blocked
+	cells onto themselves. Each is stored as a cell permutation plus byte
+	lookup tables to transform a whole peg mask eight cells at a time.'''
+
+	def __init__(self, lines, columns, blocked):
+		self.lines = lines
+		self.columns = columns
+		self.blocked = blocked
+		self.cells = ((1 << (lines * columns)) - 1) & ~blocked
+		self.pagodas = None
+		self.patterns = None
+		self.arrays = None
+
+		# Cells of each of the three diagonals in both directions, for the
+		# position classes, and the cells of a single peg of each class
+		self.diagonals = [[0] * 3, [0] * 3]
+		for line in range(lines):
+			for column in range(columns):
+				bit = 1 << (line * columns + column)
+				if self.cells & bit:
+					self.diagonals[0][(line + column) % 3] |= bit
+					self.diagonals[1][(line - column) % 3] |= bit
+
+		self.class_cells = {}
+		for cell in range(lines * columns):
+			if self.cells >> cell & 1:
+				self.class_cells.setdefault(bits_class(self, 1 << cell), []).append(cell)
+
+		# Fixed seed so every process agrees on the hash of a board
+		rng = random.Random(0)
+		self.zobrist = [rng.getrandbits(64) for i in range(lines * columns)]
+
+		# Manhattan distance of each cell to the center, and the cells at each distance
+		self.weights = [abs(line - (lines >> 1)) + abs(column - (columns >> 1))
+			for line in range(lines) for column in range(columns)]
+		self.levels = [0] * (max(self.weights) + 1)
+		for cell, weight in enumerate(self.weights):
+			if not blocked >> cell & 1:
+				self.levels[weight] |= 1 << cell
+
+		self.symmetries = []
+		for transform in shape_transforms(lines, columns):
+			permutation = [0] * (lines * columns)
+			for line in range(lines):
+				for column in range(columns):
+					image = transform(line, column)
+					permutation[line * columns + column] = pos_l(image) * columns + pos_c(image)
+
+			if all(bool(blocked >> cell & 1) == bool(blocked >> image & 1)
+					for cell, image in enumerate(permutation)):
+				self.symmetries.append(permutation)
+
+		self.sym_tables = []
+		for permutation in self.symmetries:
+			tables = []
+			for chunk in range(0, lines * columns, 8):
+				table = [0] * 256
+				for byte in range(1, 256):
+					for offset in range(8):
+						if byte >> offset & 1 and chunk + offset < lines * columns:
+							table[byte] |= 1 << permutation[chunk + offset]
+				tables.append(table)
+			self.sym_tables.append(tables)
+
+		self.jumps = []
+		self.index = {}
+
+		# Same order as board_moves so both engines agree on the actions
+		for line in range(lines):
+			for column in range(columns):
+				for d_line, d_column in ((2, 0), (-2, 0), (0, -2), (0, 2)):
+					pos_initial = make_pos(line, column)
+					pos_final = make_pos(line + d_line, column + d_column)
+					if not (0 <= pos_l(pos_final) < lines and 0 <= pos_c(pos_final) < columns):
+						continue
+
+					bit_initial = self.bit(pos_initial)
+					bit_middle = self.bit(mid_pos(pos_initial, pos_final))
+					bit_final = self.bit(pos_final)
+					if (bit_initial | bit_middle | bit_final) & blocked:
+						continue
+
+					zobrist = []
+					for permutation in self.symmetries:
+						delta = 0
+						for pos in (pos_initial, mid_pos(pos_initial, pos_final), pos_final):
+							delta ^= self.zobrist[permutation[pos_l(pos) * columns + pos_c(pos)]]
+						zobrist.append(delta)
+
+					self.index[(pos_initial, pos_final)] = len(self.jumps)
+					self.jumps.append((bit_initial | bit_middle, bit_final,
+						bit_initial | bit_middle | bit_final, make_move(pos_initial, pos_final), tuple(zobrist),
+						self.weights[pos_l(pos_final) * columns + pos_c(pos_final)]
+						- self.weights[pos_l(pos_initial) * columns + pos_c(pos_initial)]
+						- self.weights[(pos_l(pos_initial) + pos_l(pos_final)) // 2 * columns
+							+ (pos_c(pos_initial) + pos_c(pos_final)) // 2]))
+
+		# Regions of cells joined by jumps: pegs in different regions never
+		# interact, and a cell in no jump is a region of its own
+		self.regions = []
+		for from_over, to, flip, move, zobrist, weight in self.jumps:
+			region = flip
+			for other in [other for other in self.regions if other & region]:
+				self.regions.remove(other)
+				region |= other
+			self.regions.append(region)
+
+		joined = sum(self.regions)
+		self.regions += [1 << cell for cell in range(lines * columns)
+			if self.cells >> cell & 1 and not joined >> cell & 1]
+
+		# Lower cell of every pair of neighbours that can start a jump, along
+		# lines and along columns
+		self.pairs = [0, 0]
+		for from_over, to, flip, move, zobrist, weight in self.jumps:
+			low = from_over & -from_over
+			if from_over == low | low << 1:
+				self.pairs[0] |= low
+			else:
+				self.pairs[1] |= low
+
+	def cell(self, pos):
+		return pos_l(pos) * self.columns + pos_c(pos)
+
+	def bit(self, pos):
+		return 1 << self.cell(pos)
+
+	def __reduce__(self):
+		# Unpickled shapes resolve to the cached instance of the process
+		return (get_shape, (self.lines, self.columns, self.blocked))
+
+def shape_transforms(lines, columns):
+	'''Returns the dihedral transformations of a lines x columns grid, the
+	identity first. The four that swap lines and columns need a square.'''
+	last_l = lines - 1
+	last_c = columns - 1
+
+	transforms = [
+		lambda l, c: make_pos(l, c),
+		lambda l, c: make_pos(last_l - l, c),
+		lambda l, c: make_pos(l, last_c - c),
+		lambda l, c: make_pos(last_l - l, last_c - c)]
+
+	if lines == columns:
+		transforms += [
+			lambda l, c: make_pos(c, l),
+			lambda l, c: make_pos(last_c - c, last_l - l),
+			lambda l, c: make_pos(c, last_l - l),
+			lambda l, c: make_pos(last_c - c, l)]
+
+	return transforms
+
+shape_cache = {}
+
+def get_shape(lines, columns, blocked):
+	'''Returns the (cached) shape with the given size and blocked mask.'''
+	key = (lines, columns, blocked)
+	if key not in shape_cache:
+		shape_cache[key] = sol_shape(lines, columns, blocked)
+	return shape_cache[key]
+
+def board_shape(board):
+	'''Returns the shape of a list of lists board.'''
+	columns = len(board[0])
+	blocked = 0
+
+	for line in range(len(board)):
+		for column in range(len(board[line])):
+			if is_blocked(get_pos(board, make_pos(line, column))):
+				blocked |= 1 << (line * columns + column)
+
+	return get_shape(len(board), columns, blocked)
+
+def board_pegs(shape, board):
+	'''Returns the peg mask of a list of lists board.'''
+	pegs = 0
+
+	for line in range(len(board)):
+		for column in range(len(board[line])):
+			pos = make_pos(line, column)
+			if is_peg(get_pos(board, pos)):
+				pegs |= shape.bit(pos)
+
+	return pegs
+
+def shape_board(shape, pegs):
+	'''Returns the list of lists board of a peg mask.'''
+	board = []
+
+	for line in range(shape.lines):
+		row = []
+		for column in range(shape.columns):
+			bit = shape.bit(make_pos(line, column))
+			if shape.blocked & bit:
+				row.append(c_blocked())
+			elif pegs & bit:
+				row.append(c_peg())
+			else:
+				row.append(c_empty())
+		board.append(row)
+
+	return board
+
+def make_state(shape, pegs, count, keys, dist):
+	'''Builds a sol_state straight from a peg mask, its number of pegs, the
+	Zobrist hashes of its symmetric images and the distance sum of its pegs,
+	skipping the board parse.'''
+	state = sol_state.__new__(sol_state)
+	state.shape = shape
+	state.pegs = pegs
+	state.count = count
+	state.keys = keys
+	state.key = min(keys)
+	state.canon = None
+	state.moves = None
+	state.dist = dist
+	return state
+
+##############################################################
+#
+#	BITBOARD METHODS - Same rules as the board methods but on
+#	peg masks, a few bitwise operations per candidate jump.
+#
+##############################################################
+
+def bits_moves(shape, pegs):
+	'''Returns every jump with a peg on from/over and a hole on to.'''
+	return [move for from_over, to, flip, move, zobrist, weight in shape.jumps
+		if (pegs & from_over) == from_over and not (pegs & to)]
+
+def move_jump(shape, move):
+	'''Returns the jump table entry of a move.'''
+	return shape.jumps[shape.index[(move_initial(move), move_final(move))]]
+
+def bits_zobrist(shape, pegs):
+	'''Returns the Zobrist hashes of the symmetric images of a peg mask.'''
+	keys = [0] * len(shape.symmetries)
+	cell = 0
+
+	while pegs:
+		if pegs & 1:
+			for i, permutation in enumerate(shape.symmetries):
+				keys[i] ^= shape.zobrist[permutation[cell]]
+		pegs >>= 1
+		cell += 1
+
+	return tuple(keys)
+
+def bits_weight(shape, pegs):
+	'''Returns the summed distance to the center of the pegs of a peg mask.'''
+	return sum(shape.weights[cell] for cell in range(shape.lines * shape.columns) if pegs >> cell & 1)
+
+def bits_min_weight(shape, pegs):
+	'''Returns the distance to the center of the closest peg, 0 with no pegs.'''
+	for weight, mask in enumerate(shape.levels):
+		if pegs & mask:
+			return weight
+	return 0
+
+def bits_stranded(shape, pegs):
+	'''Returns a lower bound of the pegs that will be left. Pegs of different
+	regions never interact, so each region with pegs keeps at least one. A
+	region where no two pegs are neighbours that can start a jump will never
+	see a jump again (jumps are the only way to get new pegs) and keeps them
+	all, which also covers pegs with nothing to jump over or into.'''
+	active = (pegs & (pegs >> 1) & shape.pairs[0]) | (pegs & (pegs >> shape.columns) & shape.pairs[1])
+	left = 0
+
+	for region in shape.regions:
+		inside = pegs & region
+		if inside:
+			left += 1 if active & region else bin(inside).count('1')
+
+	return left
+
+def bits_class(shape, pegs):
+	'''Returns the position class of a peg mask. A jump takes a peg from each
+	of the three diagonals it crosses (in both directions) and puts one
+	back, which flips the parity of the three counts, so the parities of the
+	sums of two diagonals never change. They are packed in four bits.'''
+	position_class = 0
+
+	for diagonals in shape.diagonals:
+		parities = [bin(pegs & diagonal).count('1') & 1 for diagonal in diagonals]
+		position_class = (position_class << 2) | ((parities[0] ^ parities[1]) << 1) | (parities[1] ^ parities[2])
+
+	return position_class
+
+def bits_transform(shape, pegs, symmetry):
+	'''Returns the image of a peg mask under one of the shape symmetries.'''
+	image = 0
+
+	for table in shape.sym_tables[symmetry]:
+		if not pegs:
+			break
+		image |= table[pegs & 0xff]
+		pegs >>= 8
+
+	return image
+
+def bits_canonical(shape, pegs):
+	'''Returns the smallest peg mask among the symmetric images of a peg mask.'''
+	return min(bits_transform(shape, pegs, symmetry) for symmetry in range(len(shape.symmetries)))
+
+def bits_solved(pegs):
+	'''A peg mask is solved if it has at most one bit set.'''
+	return (pegs & (pegs - 1)) == 0
+
+def bits_jumps(shape, pegs):
+	'''Returns the indexes in the jump table of the jumps available to a peg mask.'''
+	return [i for i, (from_over, to, flip, move, zobrist, weight) in enumerate(shape.jumps)
+		if (pegs & from_over) == from_over and not (pegs & to)]
+
+##############################################################
+#
+#	ARRAY METHODS - Many boards of a shape at once, as a numpy
+#	array of N boards by lines by columns that is true on pegs.
+#
+##############################################################
+
+def shape_arrays(shape):
+	'''Returns the cells jumped from, over and into by each jump of a shape,
+	as three index arrays in the order of the jump table.'''
+	if numpy is None:
+		raise ImportError('numpy is needed for the array methods')
+
+	if shape.arrays is None:
+		cells = [[], [], []]
+		for from_over, to, flip, move, zobrist, weight in shape.jumps:
+			cells[0].append(shape.cell(move_initial(move)))
+			cells[1].append((from_over ^ shape.bit(move_initial(move))).bit_length() - 1)
+			cells[2].append(shape.cell(move_final(move)))
+		shape.arrays = tuple(numpy.array(cell, dtype=numpy.intp) for cell in cells)
+
+	return shape.arrays
+
+def pegs_array(shape, pegs):
+	'''Returns the array of a list of peg masks.'''
+	size = shape.lines * shape.columns
+	data = b''.join(mask.to_bytes((size + 7) // 8, 'little') for mask in pegs)
+	bits = numpy.unpackbits(numpy.frombuffer(data, dtype=numpy.uint8).reshape(len(pegs), (size + 7) // 8), axis=1, bitorder='little')
+	return bits[:, :size].astype(bool).reshape(len(pegs), shape.lines, shape.columns)
+
+def array_pegs(shape, boards):
+	'''Returns the peg masks of an array of boards.'''
+	data = numpy.packbits(boards.reshape(len(boards), shape.lines * shape.columns), axis=1, bitorder='little')
+	return [int.from_bytes(row.tobytes(), 'little') for row in data]
+
+def array_moves(shape, boards):
+	'''Returns an N by jumps array that is true where the jump of the jump
+	table can be made on the board: the same moves as board_moves, found
+	for every board by gathering the three cells of every jump.'''
+	start, over, end = shape_arrays(shape)
+	cells = boards.reshape(len(boards), shape.lines * shape.columns)
+	return cells[:, start] & cells[:, over] & ~cells[:, end]
+
+def array_apply(shape, boards, rows, jumps):
+	'''Returns the boards made by the jumps of the jump table on the boards
+	of the given rows, one child per pair.'''
+	start, over, end = shape_arrays(shape)
+	children = boards[rows].reshape(len(rows), shape.lines * shape.columns)
+	children[numpy.arange(len(rows))[:, None], numpy.stack([start[jumps], over[jumps], end[jumps]], axis=1)] ^= True
+	return children.reshape(len(rows), shape.lines, shape.columns)
+
+def array_expand(shape, boards):
+	'''Returns every child of an array of boards, with the row of its parent
+	and the jump that made it, parents in order and jumps in the order of
+	the jump table for each of them.'''
+	rows, jumps = numpy.nonzero(array_moves(shape, boards))
+	return rows, jumps, array_apply(shape, boards, rows, jumps)
+
+##############################################################
+#
+#	SOLVERS - Searches specific to solitaire that work on peg
+#	masks and only build Nodes for the solution found.
+#
+##############################################################
+
+def solution_node(problem, jumps):
+	'''Replays a list of jump indexes from the initial state and returns the
+	last Node, so the solution looks like the one of any other search.'''
+	node = Node(problem.initial)
+	for jump in jumps:
+		node = node.child_node(problem, node.state.shape.jumps[jump][3])
+	return node
+
+def chain_node(problem, chain):
+	'''Replays a chain of canonical masks, from the one of the initial board
+	to a solved one with a jump between each two, and returns the last Node.
+	Each jump made is one that leads to some symmetric image of the next
+	mask of the chain.'''
+	shape = problem.initial.shape
+	jumps = shape.jumps
+	pegs = problem.initial.pegs
+	path = []
+
+	for canonical in chain[1:]:
+		for jump in bits_jumps(shape, pegs):
+			if bits_canonical(shape, pegs ^ jumps[jump][2]) == canonical:
+				path.append(jump)
+				pegs ^= jumps[jump][2]
+				break
+
+	return solution_node(problem, path)
+
+def depth_first_solve(problem, failed=None, stop=None):
+	'''Depth first graph search on a single peg mask: jumps are made in place
+	and undone when backtracking, so only the stack of moves is kept. Every
+	position we backtrack from cannot be solved and is remembered by its
+	canonical mask in failed, a TranspositionTable (with its default size
+	and policy when not given) whose depth is the pegs left, and the ones
+	problem.dead proves unsolvable are skipped. Moves are tried in the same
+	order as depth_first_graph_search. The search gives up, returning None,
+	once the stop event (of multiprocessing or threading) is set.'''
+
+	state = problem.initial
+	shape = state.shape
+	jumps = shape.jumps
+
+	pegs = state.pegs
+	count = state.count
+	if count <= 1:
+		return Node(state)
+	if not problem.solvable:
+		return None
+
+	# Jumps left to try at each depth and jumps made so far
+	stack = [bits_jumps(shape, pegs)]
+	path = []
+	if failed is None:
+		failed = TranspositionTable()
+	dead = problem.dead
+
+	while stack:
+		untried = stack[-1]
+
+		if untried:
+			jump = untried.pop()
+			pegs ^= jumps[jump][2]
+			count -= 1
+
+			if count <= 1:
+				path.append(jump)
+				return solution_node(problem, path)
+
+			if dead(pegs) or bits_canonical(shape, pegs) in failed:
+				pegs ^= jumps[jump][2]
+				count += 1
+				continue
+
+			path.append(jump)
+			stack.append(bits_jumps(shape, pegs))
+
+		else:
+			# Every jump from here failed, undo the one that led here
+			if stop is not None and stop.is_set():
+				return None
+			stack.pop()
+			failed.add(bits_canonical(shape, pegs), count)
+			if path:
+				pegs ^= jumps[path.pop()][2]
+				count += 1
+
+	return None
+
+def layered_solve(problem):
+	'''Breadth first search one peg count at a time: every jump removes a
+	peg, so a layer only leads to the next one and is dropped once it is
+	expanded. Boards are kept once per canonical mask and the ones
+	problem.dead proves unsolvable are skipped. The masks of a layer are
+	only needed while it is the frontier; what stays behind is, for every
+	board, the index of its parent in the layer before and the jump made,
+	as two compact arrays. Peak memory is the widest layer plus these.'''
+
+	state = problem.initial
+	shape = state.shape
+	jumps = shape.jumps
+	dead = problem.dead
+
+	if state.count <= 1:
+		return Node(state)
+	if not problem.solvable:
+		return None
+
+	# Boards of the frontier, as reached from the initial board (not their
+	# canonical images) so the jumps recorded can be replayed
+	frontier = [state.pegs]
+	history = []
+
+	while frontier:
+		seen = set()
+		boards = []
+		parents = array.array('L')
+		made = array.array('H')
+
+		for parent, pegs in enumerate(frontier):
+			for jump in bits_jumps(shape, pegs):
+				child = pegs ^ jumps[jump][2]
+				if bits_solved(child):
+					path = [jump]
+					for layer_parents, layer_made in reversed(history):
+						path.append(layer_made[parent])
+						parent = layer_parents[parent]
+					return solution_node(problem, path[::-1])
+
+				canonical = bits_canonical(shape, child)
+				if canonical in seen or dead(child):
+					continue
+				seen.add(canonical)
+
+				boards.append(child)
+				parents.append(parent)
+				made.append(jump)
+
+		history.append((parents, made))
+		frontier = boards
+
+	return None
+
+def external_solve(problem, directory=None, run_size=1 << 20, counts=None, prune=None):
+	'''Breadth first search by peg count like layered_solve, with the layers
+	on disk in directory (a temporary one when not given) instead of memory.
+	The children of a layer are collected up to run_size canonical masks at
+	a time and written as sorted runs, which are merged without duplicates
+	into the file of the next layer (see sol_records). At most run_size
+	masks are ever held in memory.
+
+	With prune, the boards problem.dead proves unsolvable are left out, as
+	in layered_solve; it is on unless counts is given. Then the number of
+	canonical masks of each layer is appended to counts: every position
+	reachable from the initial board, up to symmetry, when not pruning,
+	and only the ones not proven dead when pruning.
+
+	Nothing but the masks is kept: the solution is found back from the last
+	layer by binary searching each layer before for a parent, and replayed
+	from the initial board.'''
+
+	state = problem.initial
+	shape = state.shape
+	jumps = shape.jumps
+	width = (shape.lines * shape.columns + 7) // 8
+	if prune is None:
+		prune = counts is None
+	dead = problem.dead if prune else lambda pegs: False
+
+	if prune and state.count > 1 and not problem.solvable:
+		return None
+
+	temporary = directory is None
+	if temporary:
+		directory = tempfile.mkdtemp(prefix='solitaire-')
+	else:
+		os.makedirs(directory, exist_ok=True)
+
+	def write_run(path, pegs):
+		with open(path, 'wb') as file:
+			file.write(b''.join(canonical.to_bytes(width, 'big') for canonical in sorted(pegs)))
+
+	layers = []
+	try:
+		path = os.path.join(directory, 'layer0')
+		write_run(path, [bits_canonical(shape, state.pegs)])
+		layers.append(sol_records(shape, path))
+
+		while layers[-1] and state.count - len(layers) + 1 > 1:
+			depth = len(layers)
+			runs = []
+			children = set()
+
+			for pegs in layers[-1]:
+				for jump in bits_jumps(shape, pegs):
+					child = pegs ^ jumps[jump][2]
+					if not dead(child):
+						children.add(bits_canonical(shape, child))
+
+				if len(children) >= run_size:
+					runs.append(os.path.join(directory, 'layer{}.run{}'.format(depth, len(runs))))
+					write_run(runs[-1], children)
+					children = set()
+
+			if children or not runs:
+				runs.append(os.path.join(directory, 'layer{}.run{}'.format(depth, len(runs))))
+				write_run(runs[-1], children)
+
+			# Merge the sorted runs, keeping one of every mask
+			path = os.path.join(directory, 'layer{}'.format(depth))
+			readers = [sol_records(shape, run) for run in runs]
+			with open(path, 'wb') as file:
+				last, chunk = None, []
+				for pegs in heapq.merge(*readers):
+					if pegs != last:
+						chunk.append(pegs.to_bytes(width, 'big'))
+						last = pegs
+						if len(chunk) >= run_size:
+							file.write(b''.join(chunk))
+							chunk = []
+				file.write(b''.join(chunk))
+
+			for reader, run in zip(readers, runs):
+				reader.close()
+				os.remove(run)
+			layers.append(sol_records(shape, path))
+
+		if counts is not None:
+			counts.extend(len(layer) for layer in layers)
+
+		if state.count <= 1:
+			return Node(state)
+		if not layers[-1] or state.count - len(layers) + 1 > 1:
+			return None
+
+		# A chain of canonical masks back from a single peg to the initial
+		# board, each one a reverse jump away from the one after it
+		chain = [next(iter(layers[-1]))]
+		for layer in reversed(layers[:-1]):
+			pegs = chain[-1]
+			for from_over, to, flip, move, zobrist, weight in jumps:
+				if pegs & to and not pegs & from_over and pegs ^ flip in layer:
+					chain.append(bits_canonical(shape, pegs ^ flip))
+					break
+
+		return chain_node(problem, chain[::-1])
+
+	finally:
+		for layer in layers:
+			layer.close()
+		if temporary:
+			shutil.rmtree(directory, ignore_errors=True)
+
+def bidirectional_solve(problem, targets=None):
+	'''Breadth first search from both ends, meeting half way. Forward layers
+	grow from the initial board by jumps, pruned with problem.dead, and
+	backward layers grow by reverse jumps from a single peg on each of the
+	target cells (end_cells when not given), and the smaller one is grown
+	first until both reach the same peg count. Each layer maps canonical
+	masks to the one of their neighbour in the layer before, so a mask in
+	both last layers links a chain from the initial board to a single peg.
+
+	Jumps never add pegs to a pagoda set (see shape_pagodas), so backward
+	boards none of whose symmetric images fits in those of the initial
+	board are left out.'''
+
+	state = problem.initial
+	shape = state.shape
+	jumps = shape.jumps
+	dead = problem.dead
+
+	if state.count <= 1:
+		return Node(state)
+	if not problem.solvable:
+		return None
+	if targets is None:
+		targets = problem.end_cells(state.pegs)
+
+	# Pagoda sets the initial board has no pegs in (which must stay empty)
+	# and the others with the most pegs they can hold, if fewer than cells
+	empty, limits = [], []
+	for mask in {mask for masks in shape_pagodas(shape).values() for mask in masks}:
+		most = bin(state.pegs & mask).count('1')
+		if not most:
+			empty.append(mask)
+		elif most < bin(mask).count('1'):
+			limits.append((mask, most))
+
+	def fits(pegs):
+		return not any(pegs & mask for mask in empty) and \
+			not any(bin(pegs & mask).count('1') > most for mask, most in limits)
+
+	forward = [{bits_canonical(shape, state.pegs): None}]
+	backward = [{bits_canonical(shape, 1 << cell): None for cell in targets}]
+
+	while forward[-1] and backward[-1] and state.count - len(forward) + 1 > len(backward):
+		layer = {}
+
+		if len(forward[-1]) <= len(backward[-1]):
+			for pegs in forward[-1]:
+				for jump in bits_jumps(shape, pegs):
+					child = pegs ^ jumps[jump][2]
+					canonical = bits_canonical(shape, child)
+					if canonical not in layer and not dead(child):
+						layer[canonical] = pegs
+			forward.append(layer)
+
+		else:
+			for pegs in backward[-1]:
+				for from_over, to, flip, move, zobrist, weight in jumps:
+					if pegs & to and not pegs & from_over:
+						images = [bits_transform(shape, pegs ^ flip, symmetry)
+							for symmetry in range(len(shape.symmetries))]
+						canonical = min(images)
+						if canonical in layer or not any(fits(image) for image in images):
+							continue
+						layer[canonical] = pegs
+			backward.append(layer)
+
+	meet = next((pegs for pegs in forward[-1] if pegs in backward[-1]), None)
+	if meet is None:
+		return None
+
+	chain = [meet]
+	for layer in reversed(forward[1:]):
+		chain.append(layer[chain[-1]])
+	chain.reverse()
+	for layer in reversed(backward[1:]):
+		chain.append(layer[chain[-1]])
+
+	return chain_node(problem, chain)
+
+##############################################################
+#
+#	PAGODA FUNCTIONS - A pagoda gives each cell a weight so that
+#	no jump increases the weighted sum of the pegs: the weight
+#	of the final cell is at most the sum of the other two.
+#
+##############################################################
+
+def jump_cells(shape, jump):
+	'''Returns the (from, over, to) cells of a jump table entry.'''
+	pos_initial = move_initial(jump[3])
+	pos_final = move_final(jump[3])
+	return (shape.cell(pos_initial), shape.cell(mid_pos(pos_initial, pos_final)), shape.cell(pos_final))
+
+def pagoda_valid(shape, weights):
+	'''Checks that no jump of the shape increases the weighted peg sum.'''
+	for jump in shape.jumps:
+		cell_from, cell_over, cell_to = jump_cells(shape, jump)
+		if weights[cell_to] > weights[cell_from] + weights[cell_over]:
+			return False
+	return True
+
+def pagoda_sets(shape, cell, size=10, limit=16, budget=3000):
+	'''Enumerates pagodas for ending on a cell that weigh 1 on a set of cells
+	holding it and 0 elsewhere. Such a weighting is a pagoda when every jump
+	landing in the set starts or jumps over a cell of the set, so the sets
+	are grown from the cell by branching on the jumps that break this. The
+	last peg can only end on the cell while every set keeps a peg (the sum
+	of the goal is 1). Returns the masks of the smallest minimal sets found.'''
+
+	# Each jump as (to, from or over) masks
+	constraints = [(jump[1], jump[0]) for jump in shape.jumps]
+
+	# Smallest sets first, so the first closed ones found are the minimal ones
+	found = []
+	seen = {1 << cell}
+	heap = [(1, 1 << cell)]
+
+	while heap and budget and len(found) < limit:
+		budget -= 1
+		size_cells, cells = heapq.heappop(heap)
+
+		broken = next((from_over for to, from_over in constraints
+			if cells & to and not cells & from_over), None)
+
+		if broken is None:
+			if not any(other & cells == other for other in found):
+				found.append(cells)
+		elif size_cells < size:
+			# Either the from or the over cell joins the set
+			for bit in (broken & -broken, broken & ~(broken & -broken)):
+				if cells | bit not in seen:
+					seen.add(cells | bit)
+					heapq.heappush(heap, (size_cells + 1, cells | bit))
+
+	return found
+
+def shape_pagodas(shape):
+	'''Returns the pagoda library of a shape, built once: for every playable
+	cell, the masks of its pagoda sets.'''
+	if shape.pagodas is None:
+		shape.pagodas = {}
+		for cell in range(shape.lines * shape.columns):
+			if shape.cells >> cell & 1:
+				shape.pagodas[cell] = pagoda_sets(shape, cell)
+	return shape.pagodas
+
+##############################################################
+#
+#	TABLEBASES - Every solvable peg mask of a shape with up to
+#	some number of pegs, found backwards from the single pegs.
+#
+##############################################################
+
+class sol_records():
+	'''A sorted file of canonical peg masks of a shape, as fixed width big
+	endian records read through mmap, so lookups are a binary search and
+	the pages are shared by every process using it. Given the data instead
+	of a path, the records are kept in memory.'''
+
+	def __init__(self, shape, path, data=None):
+		self.shape = shape
+		self.path = path
+		self.width = (shape.lines * shape.columns + 7) // 8
+
+		# mmap cannot map an empty file
+		if data is None:
+			with open(path, 'rb') as file:
+				data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b''
+		self.data = data
+		self.records = len(self.data) // self.width
+
+	def __len__(self):
+		return self.records
+
+	def __iter__(self):
+		data, width = self.data, self.width
+		for start in range(0, self.records * width, width):
+			yield int.from_bytes(data[start:start + width], 'big')
+
+	def __contains__(self, pegs):
+		key = bits_canonical(self.shape, pegs).to_bytes(self.width, 'big')
+		data, width = self.data, self.width
+		low, high = 0, self.records
+
+		while low < high:
+			middle = (low + high) // 2
+			record = data[middle * width:(middle + 1) * width]
+			if record < key:
+				low = middle + 1
+			elif record > key:
+				high = middle
+			else:
+				return True
+
+		return False
+
+	def close(self):
+		if isinstance(self.data, mmap.mmap):
+			self.data.close()
+
+class sol_tablebase(sol_records):
+	'''The canonical masks of the solvable boards of a shape with at most
+	size pegs.'''
+
+	def __init__(self, shape, size, path, data=None):
+		super().__init__(shape, path, data)
+		self.size = size
+
+def tablebase_path(shape, size, directory=CACHE_DIR):
+	'''Returns the file of the tablebase of a shape, named after its size
+	and blocked cells.'''
+	return os.path.join(directory, '{}x{}-{:x}-{}.tb'.format(shape.lines, shape.columns, shape.blocked, size))
+
+def tablebase_layers(shape, size):
+	'''Returns the sets of canonical solvable masks with 1 to size pegs.
+	Each layer comes from the one before by reverse jumps: a peg on the
+	final cell with the other two empty becomes the two pegs it jumped
+	from.'''
+	layers = [{bits_canonical(shape, 1 << cell) for cell in range(shape.lines * shape.columns)
+		if shape.cells >> cell & 1}]
+
+	while len(layers) < size:
+		layer = set()
+		for pegs in layers[-1]:
+			for from_over, to, flip, move, zobrist, weight in shape.jumps:
+				if pegs & to and not pegs & from_over:
+					layer.add(bits_canonical(shape, pegs ^ flip))
+		layers.append(layer)
+
+	return layers
+
+def shape_tablebase(shape, size=8, directory=CACHE_DIR):
+	'''Returns the tablebase of a shape for boards with up to size pegs,
+	built and written to directory the first time it is needed. With no
+	directory, or one that cannot be written, it is kept in memory.'''
+	path = tablebase_path(shape, size, directory) if directory is not None else None
+
+	if path is None or not os.path.exists(path):
+		width = (shape.lines * shape.columns + 7) // 8
+		records = sorted(pegs for layer in tablebase_layers(shape, size) for pegs in layer)
+		data = b''.join(pegs.to_bytes(width, 'big') for pegs in records)
+		if path is None or not write_cache(path, data):
+			return sol_tablebase(shape, size, None, data)
+
+	return sol_tablebase(shape, size, path)
+
+def write_cache(path, data):
+	'''Writes a file of the cache directory aside and renames it, so a reader
+	never sees half a file. Returns whether it could be written.'''
+	temporary = '{}.{}'.format(path, os.getpid())
+	try:
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		with open(temporary, 'wb') as file:
+			file.write(data)
+		os.replace(temporary, path)
+	except OSError:
+		if os.path.exists(temporary):
+			os.remove(temporary)
+		return False
+	return True
+
+##############################################################
+#
+#	PATTERN DATABASES - The board cut in rectangular regions,
+#	with a table per region of the pegs it keeps for every
+#	pattern of pegs inside it.
+#
+##############################################################
+
+def shape_regions(shape, size=(4, 4)):
+	'''Cuts the board in rectangles of at most size lines and columns, as
+	even as possible. Each region is a list of (shift, mask, offset): the
+	pegs of one of its lines are pegs >> shift & mask, and go to offset in
+	the pattern index of the region.'''
+	def cut(length, most):
+		parts = -(-length // most)
+		return [length * part // parts for part in range(parts + 1)]
+
+	lines, columns = cut(shape.lines, size[0]), cut(shape.columns, size[1])
+	regions = []
+
+	for top, bottom in zip(lines, lines[1:]):
+		for left, right in zip(columns, columns[1:]):
+			width = right - left
+			regions.append([(line * shape.columns + left, (1 << width) - 1, (line - top) * width)
+				for line in range(top, bottom)])
+
+	return regions
+
+def region_index(region, pegs):
+	'''Returns the pattern index of the pegs inside a region.'''
+	index = 0
+	for shift, mask, offset in region:
+		index |= (pegs >> shift & mask) << offset
+	return index
+
+def region_table(shape, region):
+	'''Returns, for every pattern index of a region, the fewest pegs it can
+	be left with using only the jumps that stay inside it. Patterns are
+	solved by peg count, as a jump always leads to one peg less.'''
+	cells = sum(mask << shift for shift, mask, offset in region)
+	jumps = [(region_index(region, from_over), region_index(region, to), region_index(region, flip))
+		for from_over, to, flip, move, zobrist, weight in shape.jumps if flip & cells == flip]
+
+	patterns = 1 << sum(bin(mask).count('1') for shift, mask, offset in region)
+	table = bytearray(patterns)
+
+	for index in sorted(range(patterns), key=lambda index: bin(index).count('1')):
+		table[index] = min([table[index ^ flip] for from_over, to, flip in jumps
+			if index & from_over == from_over and not index & to] or [bin(index).count('1')])
+
+	return bytes(table)
+
+def shape_patterns(shape, size=(4, 4), directory=CACHE_DIR):
+	'''Returns the pattern database of a shape as a list of (region, table),
+	read from directory or built and written there the first time. With no
+	directory, or one that cannot be written, it is only kept in memory.'''
+	if shape.patterns is None:
+		regions = shape_regions(shape, size)
+		path = None
+		if directory is not None:
+			path = os.path.join(directory, '{}x{}-{:x}-{}x{}.pdb'.format(shape.lines, shape.columns, shape.blocked, *size))
+
+		if path is not None and os.path.exists(path):
+			with open(path, 'rb') as file:
+				data = file.read()
+			tables = []
+			for region in regions:
+				patterns = 1 << sum(bin(mask).count('1') for shift, mask, offset in region)
+				tables.append(data[:patterns])
+				data = data[patterns:]
+		else:
+			tables = [region_table(shape, region) for region in regions]
+			if path is not None:
+				write_cache(path, b''.join(tables))
+
+		shape.patterns = list(zip(regions, tables))
+
+	return shape.patterns
+
+##############################################################
+#
+#	PARALLEL SOLVERS - Searches spread over a pool of processes.
+#
+##############################################################
+
+# Event set when some worker of the pool finds a solution, and the failed
+# positions of the worker, which hold for every subtree it searches
+parallel_stop = None
+parallel_failed = None
+parallel_options = None
+
+def parallel_init(stop, options):
+	global parallel_stop, parallel_failed, parallel_options
+	parallel_stop = stop
+	parallel_options = options
+	parallel_failed = TranspositionTable()
+
+def parallel_subtree(task):
+	'''Searches the subtree of one board, with the options of the problem
+	given to parallel_solve, in a worker of the pool and returns the moves
+	from the initial board, if it found a solution, with the statistics of
+	the worker.'''
+	board, moves = task
+	positions = parallel_failed.hits + parallel_failed.misses
+	start = time.time()
+
+	node = depth_first_solve(solitaire(board, **parallel_options), parallel_failed, parallel_stop)
+	if node is not None:
+		parallel_stop.set()
+
+	return {'pid': os.getpid(), 'moves': moves + node.solution() if node is not None else None,
+		'time': time.time() - start, 'positions': parallel_failed.hits + parallel_failed.misses - positions,
+		'failed': len(parallel_failed)}
+
+def parallel_solve(problem, plies=2, processes=None, stats=None):
+	'''Expands the first plies of the search (without the boards problem.dead
+	proves unsolvable and one board per canonical mask) and searches the
+	subtrees of the boards left with depth_first_solve in a pool of
+	processes (one per core when not given), the ones with lowest h first.
+	The first solution found stops every other worker. Given a stats dict,
+	it gets, for every worker process, the subtrees it searched, the time
+	it took, the positions it looked up and the failed ones it keeps.'''
+	node = Node(problem.initial)
+	if problem.goal_test(node.state):
+		return node
+	if not problem.solvable:
+		return None
+
+	frontier = [node]
+	for ply in range(plies):
+		seen = set()
+		children = []
+		for node in frontier:
+			for child in node.expand(problem):
+				if problem.goal_test(child.state):
+					return child
+				canonical = child.state.canonical()
+				if canonical not in seen and not problem.dead(child.state.pegs):
+					seen.add(canonical)
+					children.append(child)
+		frontier = children
+
+	frontier.sort(key=problem.h)
+	tasks = [(child.state.get_board(), child.solution()) for child in frontier]
+	stop = multiprocessing.Event()
+	moves = None
+
+	with multiprocessing.Pool(processes, initializer=parallel_init, initargs=(stop, problem.options)) as pool:
+		for result in pool.imap_unordered(parallel_subtree, tasks):
+			if stats is not None:
+				worker = stats.setdefault(result['pid'], {'subtrees': 0, 'time': 0, 'positions': 0, 'failed': 0})
+				worker['subtrees'] += 1
+				worker['time'] += result['time']
+				worker['positions'] += result['positions']
+				worker['failed'] = result['failed']
+			if result['moves'] is not None:
+				moves = result['moves']
+				break
+		stop.set()
+
+	if moves is None:
+		return None
+
+	node = Node(problem.initial)
+	for move in moves:
+		node = node.child_node(problem, move)
+	return node
+
+def steal_worker(number, board, options, inboxes, outbox):
+	'''A worker of work_stealing_solve. It waits in its inbox for a list of
+	tasks, each the jumps from the initial board to the board to search,
+	and searches them depth first like depth_first_solve, telling the
+	coordinator when it runs out of them or finds a solution. While busy it
+	looks at the inbox every few hundred steps: asked for work it gives
+	away half its tasks or, with none left, half the untried jumps of the
+	shallowest board of its stack that has some. Boards whose jumps were
+	given away are not known to fail, so they are never kept as failed.
+	The board is searched with the options of the problem given to
+	work_stealing_solve.'''
+	problem = solitaire(board, **options)
+	state = problem.initial
+	shape = state.shape
+	jumps = shape.jumps
+	dead = problem.dead
+
+	failed = TranspositionTable()
+	inbox = inboxes[number]
+	stats = {'tasks': 0, 'steps': 0, 'given': 0}
+	tasks = []
+
+	def give(thief, stack, path, base, partial):
+		# Returns how deep the stack gave jumps away from
+		given = []
+		if tasks:
+			given = tasks[:(len(tasks) + 1) // 2]
+			del tasks[:len(given)]
+		else:
+			for depth, untried in enumerate(stack):
+				if untried:
+					half = (len(untried) + 1) // 2
+					given = [path[:base + depth] + [jump] for jump in untried[:half]]
+					del untried[:half]
+					partial = max(partial, depth)
+					break
+		stats['given'] += len(given)
+		outbox.put(('split', number, thief, given))
+		return partial
+
+	while True:
+		message = inbox.get()
+		if message[0] == 'stop':
+			outbox.put(('stats', number, stats))
+			return
+		if message[0] == 'steal':
+			outbox.put(('split', number, message[1], []))
+			continue
+		tasks.extend(message[1])
+
+		while tasks:
+			path = tasks.pop()
+			stats['tasks'] += 1
+
+			pegs = state.pegs
+			for jump in path:
+				pegs ^= jumps[jump][2]
+			count = state.count - len(path)
+			base = len(path)
+
+			# Jumps left to try at each depth below the task, and the deepest
+			# depth that gave some away
+			stack = [bits_jumps(shape, pegs)] if count > 1 else []
+			partial = -1
+			if count <= 1:
+				tasks = []
+				outbox.put(('found', number, path))
+
+			while stack:
+				stats['steps'] += 1
+				if not stats['steps'] % 256:
+					try:
+						message = inbox.get_nowait()
+					except queue.Empty:
+						message = None
+					if message is not None and message[0] == 'stop':
+						outbox.put(('stats', number, stats))
+						return
+					if message is not None:
+						partial = give(message[1], stack, path, base, partial)
+
+				untried = stack[-1]
+
+				if untried:
+					jump = untried.pop()
+					pegs ^= jumps[jump][2]
+					count -= 1
+
+					if count <= 1:
+						tasks = []
+						outbox.put(('found', number, path + [jump]))
+						break
+
+					if dead(pegs) or bits_canonical(shape, pegs) in failed:
+						pegs ^= jumps[jump][2]
+						count += 1
+						continue
+
+					path.append(jump)
+					stack.append(bits_jumps(shape, pegs))
+
+				else:
+					# Every jump from here failed, undo the one that led here
+					if len(stack) - 1 > partial:
+						failed.add(bits_canonical(shape, pegs), count)
+					stack.pop()
+					if len(path) > base:
+						pegs ^= jumps[path.pop()][2]
+						count += 1
+			else:
+				continue
+
+			# A solution was found, wait to be stopped
+			break
+		else:
+			outbox.put(('idle', number))
+
+def work_stealing_solve(problem, processes=None, stats=None):
+	'''Depth first search of a board by a number of worker processes (one
+	per core when not given) that steal work from each other, see
+	steal_worker. The first one starts with the whole search and the idle
+	ones ask the coordinator for work, which asks a busy worker in turn and
+	passes on what it gives. Every worker failing a task is known as it
+	tells the coordinator it is idle, so the search space is exhausted when
+	every worker is idle with no request for work left unanswered. Given a
+	stats dict, it gets the tasks, steps and tasks given away by each
+	worker. Returns the solution as a Node, or None.'''
+	state = problem.initial
+	if state.count <= 1:
+		return Node(state)
+	if not problem.solvable:
+		return None
+
+	processes = processes or multiprocessing.cpu_count()
+	inboxes = [multiprocessing.Queue() for number in range(processes)]
+	outbox = multiprocessing.Queue()
+	workers = [multiprocessing.Process(target=steal_worker, args=(number, state.get_board(), problem.options, inboxes, outbox), daemon=True)
+		for number in range(processes)]
+	for worker in workers:
+		worker.start()
+
+	inboxes[0].put(('tasks', [[]]))
+	idle = set(range(1, processes))
+	asked = {}
+	turn = 0
+	path = None
+
+	while len(idle) < processes or asked:
+		# Every idle worker waits on a request to some busy one
+		busy = [number for number in range(processes) if number not in idle]
+		for thief in idle:
+			if thief not in asked and busy:
+				turn += 1
+				asked[thief] = busy[turn % len(busy)]
+				inboxes[asked[thief]].put(('steal', thief))
+
+		message = outbox.get()
+		if message[0] == 'found':
+			path = message[2]
+			break
+		elif message[0] == 'idle':
+			idle.add(message[1])
+		elif message[0] == 'split':
+			victim, thief, given = message[1:]
+			del asked[thief]
+			if given:
+				idle.discard(thief)
+				inboxes[thief].put(('tasks', given))
+
+	for inbox in inboxes:
+		inbox.put(('stop',))
+	stopped = 0
+	while stopped < processes:
+		message = outbox.get()
+		if message[0] == 'stats':
+			stopped += 1
+			if stats is not None:
+				stats[message[1]] = message[2]
+	for worker in workers:
+		worker.join()
+
+	return solution_node(problem, path) if path is not None else None
+
+##############################################################
+#
+#	COMMAND LINE - python -m solitaire batch [file]
+#
+##############################################################
+
+SOLVERS = ['depth_first_solve', 'layered_solve', 'bidirectional_solve', 'external_solve',
+	'depth_first_graph_search', 'breadth_first_search', 'greedy_search', 'astar_search']
+
+class BatchTimeout(Exception):
+	pass
+
+def batch_alarm(signum, frame):
+	raise BatchTimeout()
+
+def batch_error(error):
+	return '{}: {}'.format(type(error).__name__, error)
+
+def batch_check(board):
+	'''Raises ValueError unless the board is a non-empty list of rows of the
+	same non-zero length, each a list of pegs, empty and blocked cells.'''
+	if not isinstance(board, list) or not board or \
+		not all(isinstance(row, list) and row and len(row) == len(board[0]) for row in board) or \
+		not all(cell in (c_peg(), c_empty(), c_blocked()) for row in board for cell in row):
+		raise ValueError('not a board of rows of the same length of "{}", "{}" and "{}"'.format(c_peg(), c_empty(), c_blocked()))
+
+def batch_boards(lines):
+	'''Yields (id, board, error) for every line with a board, either a list
+	literal as in tests_benchmark or JSON, which may also be an object with
+	the board and its id. Boards without an id are numbered by line, and
+	lines that cannot be read or are not a board (see batch_check) yield no
+	board but the error message.'''
+	for number, line in enumerate(lines, 1):
+		line = line.strip()
+		if not line:
+			continue
+		id = number
+		try:
+			try:
+				board = json.loads(line)
+			except ValueError:
+				board = ast.literal_eval(line)
+			if isinstance(board, dict):
+				id, board = board.get('id', number), board['board']
+			batch_check(board)
+		except (ValueError, SyntaxError, KeyError) as error:
+			yield id, None, batch_error(error)
+		else:
+			yield id, board, None
+
+def batch_solve(job):
+	'''Solves one board in a worker of the pool and returns its result as a
+	dict: the status (solved, unsolvable, timeout or error, with its
+	message), the moves of the solution, the counts of the search and the
+	wall time. The searches of search.py count nodes; depth_first_solve
+	counts the positions it looked up in its failed table, the hits among
+	them and the failed ones it keeps; the other *_solve searches count
+	nothing, as they do not expand nodes.'''
+	id, board, solver, timeout = job
+	result = {'id': id}
+	problem = failed = node = None
+	start = time.time()
+
+	signal.signal(signal.SIGALRM, batch_alarm)
+	signal.alarm(timeout)
+	try:
+		if solver == 'depth_first_solve':
+			problem, failed = solitaire(board), TranspositionTable()
+			solve = lambda problem: depth_first_solve(problem, failed)
+		elif solver.endswith('_solve'):
+			problem, solve = solitaire(board), globals()[solver]
+		else:
+			problem, solve = InstrumentedProblem(solitaire(board)), globals()[solver]
+		# Boards the position class rules out are not searched at all
+		node = solve(problem) if problem.solvable else None
+		result['status'] = 'solved' if node is not None else 'unsolvable'
+	except BatchTimeout:
+		result['status'] = 'timeout'
+	except Exception as error:
+		result['status'] = 'error'
+		result['error'] = batch_error(error)
+	finally:
+		signal.alarm(0)
+
+	result['moves'] = node.solution() if node is not None else None
+	if failed is not None:
+		result.update(positions=failed.hits + failed.misses, hits=failed.hits, failed=len(failed))
+	elif isinstance(problem, InstrumentedProblem):
+		result.update(succs=problem.succs, goal_tests=problem.goal_tests, states=problem.states)
+	result['time'] = round(time.time() - start, 6)
+	return result
+
+def batch(arguments):
+	'''Solves every board of a file (or stdin) in a pool of processes and
+	prints a JSON line per board as soon as it is done, after one for each
+	line that is not a board.'''
+	with (open(arguments.file) if arguments.file != '-' else sys.stdin) as file:
+		boards = list(batch_boards(file))
+
+	for id, board, error in boards:
+		if error is not None:
+			print(json.dumps({'id': id, 'status': 'error', 'error': error}), flush=True)
+	jobs = [(id, board, arguments.solver, arguments.timeout) for id, board, error in boards if error is None]
+
+	with multiprocessing.Pool(arguments.processes) as pool:
+		for result in pool.imap_unordered(batch_solve, jobs):
+			print(json.dumps(result), flush=True)
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog='python -m solitaire', description='Solitaire solver.')
+	commands = parser.add_subparsers(dest='command', required=True)
+
+	command = commands.add_parser('batch', help='solve a file of boards, one per line, in parallel')
+	command.add_argument('file', nargs='?', default='-', help='boards as list literals or JSON lines (default: stdin)')
+	command.add_argument('-s', '--solver', choices=SOLVERS, default='depth_first_solve', help='search to use (default: %(default)s)')
+	command.add_argument('-p', '--processes', type=int, default=None, help='worker processes (default: one per core)')
+	command.add_argument('-t', '--timeout', type=int, default=60, help='seconds per board, 0 for none (default: %(default)s)')
+	command.set_defaults(run=batch)
+
+	arguments = parser.parse_args(argv)
+	arguments.run(arguments)
+
+if __name__ == '__main__':
+	main()
@@ -8,6 +8,7 @@ import os.path
 import random
 import math
 import functools
+import heapq
 from itertools import chain, combinations
 
 
@@ -680,14 +681,15 @@ class Queue:
         Stack(): A Last In First Out Queue.
         FIFOQueue(): A First In First Out Queue.
         PriorityQueue(order, f): Queue in sorted order (default min-first).
+        BucketQueue(f, order): PriorityQueue for small non-negative integer f.
     Each type supports the following methods and functions:
         q.append(item)  -- add an item to the queue
         q.extend(items) -- equivalent to: for item in items: q.append(item)
         q.pop()         -- return the top item from the queue
         len(q)          -- number of items in q (also q.__len())
         item in q       -- does q contain item?
-    Note that isinstance(Stack(), Queue) is false, because we implement stacks
-    as lists.  If Python ever gets interfaces, Queue will be an interface."""
+    Stack and FIFOQueue also count how many times each item is queued, so
+    "item in q" is a dict lookup instead of a scan (items must be hashable)."""
 
     def __init__(self):
         raise NotImplementedError
@@ -696,10 +698,39 @@ class Queue:
         for item in items:
             self.append(item)
 
+    def index_add(self, item):
+        self.index[item] = self.index.get(item, 0) + 1
 
-def Stack():
-    """Return an empty list, suitable as a Last-In-First-Out Queue."""
-    return []
+    def index_remove(self, item):
+        count = self.index[item] - 1
+        if count:
+            self.index[item] = count
+        else:
+            del self.index[item]
+
+
+class Stack(Queue):
+
+    """A Last-In-First-Out Queue."""
+
+    def __init__(self):
+        self.stack = []
+        self.index = {}
+
+    def append(self, item):
+        self.stack.append(item)
+        self.index_add(item)
+
+    def pop(self):
+        item = self.stack.pop()
+        self.index_remove(item)
+        return item
+
+    def __len__(self):
+        return len(self.stack)
+
+    def __contains__(self, item):
+        return item in self.index
 
 
 class FIFOQueue(Queue):
@@ -708,22 +739,31 @@ class FIFOQueue(Queue):
 
     def __init__(self, maxlen=None, items=[]):
         self.queue = collections.deque(items, maxlen)
+        self.index = {}
+        for item in self.queue:
+            self.index_add(item)
 
     def append(self, item):
         if not self.queue.maxlen or len(self.queue) < self.queue.maxlen:
             self.queue.append(item)
+            self.index_add(item)
         else:
             raise Exception('FIFOQueue is full')
 
     def extend(self, items):
+        items = list(items)
         if not self.queue.maxlen or len(self.queue) + len(items) <= self.queue.maxlen:
             self.queue.extend(items)
+            for item in items:
+                self.index_add(item)
         else:
             raise Exception('FIFOQueue max length exceeded')
 
     def pop(self):
         if len(self.queue) > 0:
-            return self.queue.popleft()
+            item = self.queue.popleft()
+            self.index_remove(item)
+            return item
         else:
             raise Exception('FIFOQueue is empty')
 
@@ -731,7 +771,36 @@ class FIFOQueue(Queue):
         return len(self.queue)
 
     def __contains__(self, item):
-        return item in self.queue
+        return item in self.index
+
+
+class QueueEntry:
+
+    """An item of PriorityQueue or BucketQueue with its priority f(x) and
+    the number of items appended before it. Entries order by key, then by
+    the items' own <, then by number, so items neither smaller nor larger
+    than each other come out in the order they went in, as bisect.insort
+    kept them; reverse turns the whole order around. Deleting an item
+    clears alive, and pop skips the entry later."""
+
+    __slots__ = ('key', 'item', 'number', 'reverse', 'alive')
+
+    def __init__(self, key, item, number, reverse=False):
+        self.key = key
+        self.item = item
+        self.number = number
+        self.reverse = reverse
+        self.alive = True
+
+    def __lt__(self, other):
+        a, b = (other, self) if self.reverse else (self, other)
+        if a.key != b.key:
+            return a.key < b.key
+        if a.item < b.item:
+            return True
+        if b.item < a.item:
+            return False
+        return a.number < b.number
 
 
 class PriorityQueue(Queue):
@@ -739,37 +808,256 @@ class PriorityQueue(Queue):
     """A queue in which the minimum (or maximum) element (as determined by f and
     order) is returned first. If order is min, the item with minimum f(x) is
     returned first; if order is max, then it is the item with maximum f(x).
-    Also supports dict-like lookup."""
+    Also supports dict-like lookup.
+    Items live in a binary heap of QueueEntry, with a dict from item to its
+    entry: membership and lookup are O(1), append and pop are O(log n), and
+    deleting only marks the entry so pop skips it later. Ties come out in
+    the order they went in (min) or the reverse (max)."""
 
     def __init__(self, order=min, f=lambda x: x):
-        self.A = []
+        self.heap = []
+        self.index = {}
+        self.size = 0
+        self.number = 0
         self.order = order
         self.f = f
 
     def append(self, item):
-        bisect.insort(self.A, (self.f(item), item))
+        entry = QueueEntry(self.f(item), item, self.number, self.order != min)
+        self.number += 1
+        self.index[item] = entry
+        heapq.heappush(self.heap, entry)
+        self.size += 1
 
     def __len__(self):
-        return len(self.A)
+        return self.size
 
     def pop(self):
-        if self.order == min:
-            return self.A.pop(0)[1]
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            if entry.alive:
+                item = entry.item
+                if self.index.get(item) is entry:
+                    del self.index[item]
+                self.size -= 1
+                return item
+        raise Exception('PriorityQueue is empty')
+
+    def __contains__(self, item):
+        return item in self.index
+
+    def __getitem__(self, key):
+        entry = self.index.get(key)
+        if entry:
+            return entry.item
+
+    def __delitem__(self, key):
+        entry = self.index.pop(key)
+        entry.alive = False
+        self.size -= 1
+
+
+class BucketQueue(Queue):
+
+    """A queue for small non-negative integer priorities f(x): there is one
+    bucket per value of f, so append is O(1) and pop only scans up from the
+    lowest bucket that may hold items, which is amortised O(1) when f does
+    not jump far below it. Items with the same f(x) come out in the given
+    order: 'lifo', 'fifo' or 'sorted' (by the items' own <, then in the order
+    they went in, like the ties of PriorityQueue). Supports the same dict-like lookup as PriorityQueue,
+    with deleted entries skipped when popped."""
+
+    def __init__(self, f=lambda x: x, order='lifo', size=0):
+        if order not in ('lifo', 'fifo', 'sorted'):
+            raise ValueError('Unknown BucketQueue order {}'.format(order))
+        self.order = order
+        self.f = f
+        self.buckets = [self.bucket() for _ in range(size)]
+        self.index = {}
+        self.size = 0
+        self.number = 0
+        self.low = 0
+
+    def bucket(self):
+        return collections.deque() if self.order == 'fifo' else []
+
+    def append(self, item):
+        key = self.f(item)
+        if not isinstance(key, int) or key < 0:
+            raise ValueError('BucketQueue priorities must be non-negative integers, got {}'.format(key))
+        while key >= len(self.buckets):
+            self.buckets.append(self.bucket())
+
+        entry = QueueEntry(key, item, self.number)
+        self.number += 1
+        if self.order == 'sorted':
+            heapq.heappush(self.buckets[key], entry)
         else:
-            return self.A.pop()[1]
+            self.buckets[key].append(entry)
+        self.index[item] = entry
+        self.size += 1
+        self.low = min(self.low, key)
+
+    def __len__(self):
+        return self.size
+
+    def pop(self):
+        while self.low < len(self.buckets):
+            bucket = self.buckets[self.low]
+            while bucket:
+                if self.order == 'lifo':
+                    entry = bucket.pop()
+                elif self.order == 'fifo':
+                    entry = bucket.popleft()
+                else:
+                    entry = heapq.heappop(bucket)
+                if entry.alive:
+                    item = entry.item
+                    if self.index.get(item) is entry:
+                        del self.index[item]
+                    self.size -= 1
+                    return item
+            self.low += 1
+        raise Exception('BucketQueue is empty')
 
     def __contains__(self, item):
-        return any(item == pair[1] for pair in self.A)
+        return item in self.index
 
     def __getitem__(self, key):
-        for _, item in self.A:
-            if item == key:
-                return item
+        entry = self.index.get(key)
+        if entry:
+            return entry.item
 
     def __delitem__(self, key):
-        for i, (value, item) in enumerate(self.A):
-            if item == key:
-                self.A.pop(i)
+        entry = self.index.pop(key)
+        entry.alive = False
+        self.size -= 1
+
+
+# ______________________________________________________________________________
+# Transposition Tables
+
+
+class TranspositionTable:
+
+    """A set of keys with a fixed capacity, for positions already known to
+    fail. When full, the policy chooses what to forget:
+        'depth': two slots per hash value, one keeps the key of largest
+                 depth (the work it saves) and the other the latest key,
+                 so the size must be at least 2 and an odd one is rounded
+                 down.
+        'lru':   the least recently stored or found key goes first.
+        'clock': second chance: keys found since the hand last passed them
+                 are spared once.
+    Counts hits and misses of "key in t" and evictions (keys forgotten or
+    refused because the table was full)."""
+
+    def __init__(self, size=1 << 20, policy='depth'):
+        if policy not in ('depth', 'lru', 'clock'):
+            raise ValueError('Unknown TranspositionTable policy {}'.format(policy))
+        if size < (2 if policy == 'depth' else 1):
+            raise ValueError('TranspositionTable size too small for policy {}, got {}'.format(policy, size))
+        self.size = size & ~1 if policy == 'depth' else size
+        self.policy = policy
+        self.hits = self.misses = self.evictions = 0
+        if policy == 'depth':
+            self.slots = [None] * self.size
+            self.used = 0
+        elif policy == 'lru':
+            self.entries = collections.OrderedDict()
+        else:
+            self.slots = [None] * size
+            self.marks = [False] * size
+            self.index = {}
+            self.hand = 0
+
+    def slot(self, key):
+        return (hash(key) * 0x9E3779B97F4A7C15 >> 17) % (len(self.slots) >> 1) << 1
+
+    def add(self, key, depth=0):
+        if self.policy == 'depth':
+            i = self.slot(key)
+            deep, last = self.slots[i], self.slots[i + 1]
+            if deep is not None and deep[0] == key:
+                self.slots[i] = (key, max(depth, deep[1]))
+                return
+            if last is not None and last[0] == key:
+                if depth <= last[1]:
+                    return
+                self.slots[i + 1] = None
+                self.used -= 1
+                last = None
+            if deep is None or depth >= deep[1]:
+                self.slots[i] = (key, depth)
+                entry = deep
+            else:
+                entry = (key, depth)
+            if entry is not None:
+                if last is None:
+                    self.used += 1
+                else:
+                    self.evictions += 1
+                self.slots[i + 1] = entry
+            if deep is None:
+                self.used += 1
+
+        elif self.policy == 'lru':
+            self.entries[key] = depth
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+        elif key in self.index:
+            self.marks[self.index[key]] = True
+
+        else:
+            while len(self.index) == self.size:
+                if self.marks[self.hand]:
+                    self.marks[self.hand] = False
+                else:
+                    del self.index[self.slots[self.hand]]
+                    self.slots[self.hand] = None
+                    self.evictions += 1
+                    break
+                self.hand = (self.hand + 1) % self.size
+            while self.slots[self.hand] is not None:
+                self.hand = (self.hand + 1) % self.size
+            self.slots[self.hand] = key
+            self.marks[self.hand] = False
+            self.index[key] = self.hand
+            self.hand = (self.hand + 1) % self.size
+
+    def __contains__(self, key):
+        if self.policy == 'depth':
+            i = self.slot(key)
+            deep, last = self.slots[i], self.slots[i + 1]
+            found = (deep is not None and deep[0] == key) or (last is not None and last[0] == key)
+        elif self.policy == 'lru':
+            found = key in self.entries
+            if found:
+                self.entries.move_to_end(key)
+        else:
+            found = key in self.index
+            if found:
+                self.marks[self.index[key]] = True
+
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return found
+
+    def __len__(self):
+        if self.policy == 'depth':
+            return self.used
+        if self.policy == 'lru':
+            return len(self.entries)
+        return len(self.index)
+
+    def __repr__(self):
+        return '<{} {}/{}: {} hits, {} misses, {} evictions>'.format(
+            self.policy, len(self), self.size, self.hits, self.misses, self.evictions)
 
 
 # ______________________________________________________________________________